@@ -1,51 +1,293 @@
 import asyncio
+import contextlib
 import logging
-from typing import Literal, assert_never
+import logging.handlers
+import queue
+import sys
+from typing import TYPE_CHECKING, Literal, assert_never, cast
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+if sys.platform != "win32":
+    import uvloop
 
 DEFAULT_ROOM = "LOBBY"
 MAX_NAME_LENGTH = 16
+LOGIN_TIMEOUT = 30  # seconds
+MAX_LOGIN_ATTEMPTS = 5
+MAX_LOGIN_LINE_LENGTH = 128
+OUT_QUEUE_SIZE = 64  # frames queued behind a paused transport before the client is dropped
+FLUSH_INTERVAL = 0.005  # seconds
+MAX_LINE_LENGTH = 4096
+MAX_BATCH_SIZE = 64 * 1024
+WRITE_HIGH_WATER = 64 * 1024
+WRITE_LOW_WATER = 16 * 1024
+
+# Wraps a message so it is inserted above the user's prompt line
+ANSI_PREFIX = b"\033[s\n\r\033[A\033[L"
+ANSI_SUFFIX = b"\033[u\033[B"
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message and traceback on the calling thread,
+    # pass the record through untouched so the listener thread does all formatting
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:  # noqa: PLR6301
+        return record
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    # The event loop only enqueues records, a helper thread owns the blocking stderr writes
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    stderr_handler = logging.StreamHandler()
+    stderr_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    return logging.handlers.QueueListener(log_queue, stderr_handler)
+
+
+def _encode_tty(message: str) -> bytes:
+    return message.rstrip().encode("ascii", errors="replace") + b"\r\n"
+
+
+def _encode_terminal(message: str) -> bytes:
+    return b"".join((ANSI_PREFIX, message.rstrip().encode(), ANSI_SUFFIX))
+
+
+class ChatProtocol(asyncio.Protocol):
+    # Minimal line reader on top of the transport, avoiding the overhead of the Streams layer
+    def __init__(self, server: ChatServer, limit: int = MAX_LINE_LENGTH) -> None:
+        self.server: ChatServer = server
+        self.limit: int = limit
+        self.transport: asyncio.Transport
+        self._buffer: bytearray = bytearray()
+        self._eof: bool = False
+        self._reading_paused: bool = False
+        self._waiter: asyncio.Future[None] | None = None
+        self._can_write: asyncio.Event = asyncio.Event()
+        self._can_write.set()
+        self._closed: asyncio.Event = asyncio.Event()
+        self._handler: asyncio.Task[None] | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast("asyncio.Transport", transport)
+        self.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER, low=WRITE_LOW_WATER)
+        self._handler = asyncio.create_task(self.server.handle_client(self))
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        # Stop reading from the socket until the handler consumes what is already buffered
+        if len(self._buffer) > self.limit and not self._reading_paused and not self.transport.is_closing():
+            self.transport.pause_reading()
+            self._reading_paused = True
+        self._wakeup()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup()
+        return True  # Keep the transport open so queued output can still be flushed
+
+    def connection_lost(self, exc: Exception | None) -> None:  # noqa: ARG002
+        self._eof = True
+        self._closed.set()
+        self._can_write.set()
+        self._wakeup()
+
+    def pause_writing(self) -> None:
+        self._can_write.clear()
+
+    def resume_writing(self) -> None:
+        self._can_write.set()
+
+    def _maybe_resume_reading(self) -> None:
+        if self._reading_paused and len(self._buffer) <= self.limit:
+            self._reading_paused = False
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    def _wakeup(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait_for_data(self) -> None:
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    async def read(self) -> bytes:
+        while not self._buffer and not self._eof:
+            await self._wait_for_data()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._maybe_resume_reading()
+        return data
+
+    async def readline(self, limit: int | None = None) -> bytes:
+        if limit is None:
+            limit = self.limit
+        start = 0
+        while (end := self._buffer.find(b"\n", start)) == -1:
+            if len(self._buffer) > limit:
+                break
+            if self._eof:
+                return await self.read()
+            start = len(self._buffer)
+            await self._wait_for_data()
+        if end == -1 or end > limit:
+            msg = "Line is longer than the limit"
+            raise asyncio.LimitOverrunError(msg, len(self._buffer))
+        line = bytes(self._buffer[: end + 1])
+        del self._buffer[: end + 1]
+        self._maybe_resume_reading()
+        return line
+
+    @property
+    def writing_paused(self) -> bool:
+        return not self._can_write.is_set()
+
+    async def drain(self) -> None:
+        await self._can_write.wait()
+        if self._closed.is_set():
+            msg = "Connection lost"
+            raise ConnectionResetError(msg)
+
+    async def wait_closed(self) -> None:
+        await self._closed.wait()
+
+
 class Client:
-    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        self.reader: asyncio.StreamReader = reader
-        self.writer: asyncio.StreamWriter = writer
+    def __init__(self, protocol: ChatProtocol) -> None:
+        self.protocol: ChatProtocol = protocol
+        self.transport: asyncio.Transport = protocol.transport
         self.name: str = ""
-        self.room_name: str = ""
-        self.mode: Literal["terminal", "tty"] = "tty"
+        self.room: Room | None = None
+        self._mode: Literal["terminal", "tty"] = "tty"
+        # Bound once per mode change so sends don't dispatch on the mode every time
+        self.encode: Callable[[str], bytes] = _encode_tty
         self._closing: bool = False
-
-    async def send_raw(self, data: bytes) -> None:
+        # Outbound frames are written by a dedicated task so a slow socket only stalls itself.
+        # Both are only created once the client has logged in.
+        self.out_queue: asyncio.Queue[bytes] | None = None
+        self._writer_task: asyncio.Task[None] | None = None
+
+    def start_writer(self) -> None:
+        self.out_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop(self.out_queue))
+
+    async def _writer_loop(self, queue: asyncio.Queue[bytes]) -> None:
+        loop = asyncio.get_running_loop()
+        # Runs until disconnect() shuts the queue down and everything queued before that is flushed
+        with contextlib.suppress(asyncio.QueueShutDown):
+            while True:
+                data = await queue.get()
+                # Coalesce frames arriving within FLUSH_INTERVAL into a single write
+                batch = [data]
+                size = len(data)
+                deadline = loop.time() + FLUSH_INTERVAL
+                while size < MAX_BATCH_SIZE:
+                    try:
+                        data = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        try:
+                            data = await asyncio.wait_for(queue.get(), timeout=deadline - loop.time())
+                        except (TimeoutError, asyncio.QueueShutDown):
+                            break
+                    except asyncio.QueueShutDown:
+                        break
+                    batch.append(data)
+                    size += len(data)
+                if self.transport.is_closing():
+                    self._closing = True
+                    return
+                self.transport.write(b"".join(batch))
+                # Only yield to the loop once the transport buffer passes the high-water mark
+                if self.protocol.writing_paused:
+                    try:
+                        await self.protocol.drain()
+                    except ConnectionError:
+                        self._closing = True
+                        return
+
+    def send_raw(self, data: bytes) -> None:
         if self._closing:
             return
-        try:
-            self.writer.write(data)
-            await self.writer.drain()
-        except ConnectionError:
+        if self.out_queue is None:
+            # Not logged in yet, write directly and let prompt() wait for the peer to read
+            self.transport.write(data)
+            return
+        # A burst of fanout can queue many frames before the writer gets to run, so only drop a
+        # client whose transport is over its high-water mark and still has a backlog behind it.
+        # Aborting wakes its readline with EOF, so handle_client runs cleanup_client like for
+        # any other disconnect
+        if self.protocol.writing_paused and self.out_queue.qsize() >= OUT_QUEUE_SIZE:
+            logger.warning("Outbound queue full for %s, dropping client", self.name)
             self._closing = True
-
-    async def send_message(self, message: str) -> None:
-        message = message.rstrip()
-        match self.mode:
+            self.transport.abort()
+            return
+        self.out_queue.put_nowait(data)
+
+    async def prompt(self, prompt: bytes) -> bytes:
+        # Pre-login sends bypass the queue, so wait for the peer to read before asking again
+        self.send_raw(prompt)
+        if self.protocol.writing_paused:
+            await self.protocol.drain()
+        return await self.protocol.readline(limit=MAX_LOGIN_LINE_LENGTH)
+
+    @property
+    def mode(self) -> Literal["terminal", "tty"]:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: Literal["terminal", "tty"]) -> None:
+        self._mode = mode
+        match mode:
             case "tty":
-                data = message.encode("ascii", errors="replace") + b"\r\n"
+                self.encode = _encode_tty
             case "terminal":
-                data = b"\033[s\n\r\033[A\033[L" + message.encode() + b"\033[u\033[B"
+                self.encode = _encode_terminal
             case _:
-                assert_never(self.mode)
-        await self.send_raw(data)
+                assert_never(mode)
+
+    def send_message(self, message: str) -> None:
+        self.send_raw(self.encode(message))
 
     async def disconnect(self) -> None:
         self._closing = True
         try:
-            self.writer.close()
-            await self.writer.wait_closed()
+            if self.out_queue is not None and self._writer_task is not None:
+                # Shutting the queue down lets the writer flush what is already queued, then exit
+                self.out_queue.shutdown()
+                await self._writer_task
         except Exception:
             logger.exception("Error closing client connection")
+        finally:
+            self.transport.close()
+        await self.protocol.wait_closed()
+
+
+class Room:
+    # Self-contained room state, so the broadcast hot path never touches the server's dicts
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.members: set[Client] = set()
+
+    def broadcast(self, message: str, exclude: Client | None = None) -> None:
+        # Encode once per terminal mode and hand every recipient the same bytes object
+        frames: dict[Callable[[str], bytes], bytes] = {}
+        for user in self.members:
+            if user is not exclude:
+                encode = user.encode
+                frame = frames.get(encode)
+                if frame is None:
+                    frame = frames[encode] = encode(message)
+                user.send_raw(frame)
 
 
 class ChatServer:
@@ -54,10 +296,17 @@ class ChatServer:
         self.port: int = port
         # State management
         self.clients: set[Client] = set()  # Set of Client objects
-        self.rooms: dict[str, set[Client]] = {}  # Dict: room_name -> Set[Client]
+        self.rooms: dict[str, Room] = {}  # Dict: room_name -> Room
+        self.names: dict[str, Client] = {}  # Dict: lowercased name -> Client
+        # Command dispatch table, matched against the raw bytes of the command name
+        self._commands: dict[bytes, Callable[[Client, str], Awaitable[None]]] = {
+            m[4:].encode(): getattr(self, m) for m in dir(self) if m.startswith("cmd_")
+        }
+        self._help_text: str = "Available commands: " + ", ".join("/" + c.decode().upper() for c in self._commands)
 
     async def start(self) -> None:
-        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: ChatProtocol(self, limit=MAX_LINE_LENGTH), self.host, self.port)
 
         addr = server.sockets[0].getsockname()
         logger.info("Serving on %s", addr)
@@ -65,39 +314,49 @@ class ChatServer:
         async with server:
             await server.serve_forever()
 
-    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        client = Client(reader, writer)
-        addr = writer.get_extra_info("peername")
+    async def handle_client(self, protocol: ChatProtocol) -> None:
+        client = Client(protocol)
+        addr = protocol.transport.get_extra_info("peername")
         logger.info("New connection from %s", addr)
 
         try:
             # 1. Login Phase
-            await self.login_handshake(client)
+            await asyncio.wait_for(self.login_handshake(client), timeout=LOGIN_TIMEOUT)
 
             # 2. Add to Default Room
+            client.start_writer()
             self.clients.add(client)
-            await self.join_room(client, DEFAULT_ROOM)
+            self.join_room(client, DEFAULT_ROOM)
 
             logger.info("%s logged in as %s", addr, client.name)
 
             # 3. Main Loop
             while True:
                 if client.mode == "terminal":
-                    await client.send_raw(b"> ")
-                data = await reader.readline()
+                    client.send_raw(b"> ")
+                data = await protocol.readline()
                 if not data:  # EOF (Client disconnected)
                     break
 
-                message = data.decode().strip()
-                if not message:
+                data = data.strip()
+                if not data:
                     continue
 
-                if message.startswith("/"):
-                    await self.handle_command(client, message)
+                if data.startswith(b"/"):
+                    await self.handle_command(client, data)
                 else:
-                    await self.broadcast_chat(client, message)
+                    self.broadcast_chat(client, data.decode())
+
+                # Buffered lines are returned without suspending, so yield to let the writer tasks
+                # drain their queues before the next line is fanned out
+                await asyncio.sleep(0)
 
-        except (ConnectionError, asyncio.IncompleteReadError):
+        except TimeoutError:
+            logger.info("Login timed out for %s", addr)
+        except asyncio.LimitOverrunError:
+            logger.info("Line too long from %s, closing connection", addr)
+            client.send_message("Line too long.")
+        except ConnectionError:
             pass  # Expected on disconnect
         except Exception:
             logger.exception("Error handling client %s", addr)
@@ -106,19 +365,24 @@ class ChatServer:
             logger.info("Connection closed for %s", addr)
 
     async def login_handshake(self, client: Client) -> None:  # noqa: C901
-        await client.send_message("Welcome to netchat!")
+        client.send_message("Welcome to netchat!")
 
         try:
-            data = await asyncio.wait_for(client.reader.read(1024), timeout=0.2)
+            data = await asyncio.wait_for(client.protocol.read(), timeout=0.2)
             if b"\xff" in data:
                 logger.info("Detected telnet negotiation bytes from client.")
                 client.mode = "terminal"
         except TimeoutError:
             pass  # No data received, proceed normally
 
+        attempts = 0
         while True:
-            await client.send_raw(b"Enter Username: ")
-            data = await client.reader.readline()
+            if attempts >= MAX_LOGIN_ATTEMPTS:
+                client.send_message("Too many failed attempts.")
+                msg = "Too many failed login attempts"
+                raise ConnectionError(msg)
+
+            data = await client.prompt(b"Enter Username: ")
             if not data:
                 msg = "Client disconnected during login"
                 raise ConnectionError(msg)
@@ -126,23 +390,30 @@ class ChatServer:
             name = data.decode().strip()
 
             if not name:
+                attempts += 1
                 continue
 
             if not name.isalnum() or len(name) > MAX_NAME_LENGTH:
-                await client.send_message(f"Invalid name. Use alphanumeric characters (max {MAX_NAME_LENGTH}).")
+                attempts += 1
+                client.send_message(f"Invalid name. Use alphanumeric characters (max {MAX_NAME_LENGTH}).")
                 continue
 
-            if any(c.name.lower() == name.lower() for c in self.clients if c.name):
-                await client.send_message(f"The name '{name}' is already taken. Try again.")
+            name_lc = name.lower()
+            if name_lc in self.names:
+                attempts += 1
+                client.send_message(f"The name '{name}' is already taken. Try again.")
                 continue
 
             client.name = name
-            await client.send_message(f"Welcome, {client.name}!")
+            self.names[name_lc] = client
+            client.send_message(f"Welcome, {client.name}!")
             break
 
-        while client.mode == "tty":
-            await client.send_raw(b"Does your terminal support ANSI Control Sequences? (Y/n): ")
-            data = await client.reader.readline()
+        # Stay in plain tty mode if the question keeps getting unrecognised answers
+        attempts = 0
+        while client.mode == "tty" and attempts < MAX_LOGIN_ATTEMPTS:
+            attempts += 1
+            data = await client.prompt(b"Does your terminal support ANSI Control Sequences? (Y/n): ")
 
             if data.strip() in {b"Y", b"y", b""}:
                 client.mode = "terminal"
@@ -151,106 +422,101 @@ class ChatServer:
                 client.mode = "tty"
                 break
 
-    async def broadcast_chat(self, sender: Client, message: str) -> None:
-        room = self.rooms.get(sender.room_name, set())
+    def broadcast_chat(self, sender: Client, message: str) -> None:  # noqa: PLR6301
+        room = sender.room
+        if room is None:
+            return
         formatted_msg = f"{sender.name}: {message}"
 
-        logger.info("[%s] %s", sender.room_name, formatted_msg)
+        logger.info("[%s] %s", room.name, formatted_msg)
 
-        for user in room:
-            if user != sender:
-                await user.send_message(formatted_msg)
+        room.broadcast(formatted_msg, exclude=sender)
 
-    async def join_room(self, client: Client, room_name: str) -> None:
+    def join_room(self, client: Client, room_name: str) -> None:
         room_name = room_name.upper()
-        old_room = client.room_name
+        old_room = client.room
 
-        if old_room == room_name:
-            await client.send_message(f"You are already in room: {room_name}")
+        if old_room is not None and old_room.name == room_name:
+            client.send_message(f"You are already in room: {room_name}")
             return
 
         # Remove from old room if exists
-        if old_room and old_room in self.rooms:
-            self.rooms[old_room].discard(client)
-            await self.system_message(old_room, f"{client.name} left the room.")
+        if old_room is not None:
+            old_room.members.discard(client)
+            old_room.broadcast(f"* {client.name} left the room.")
             # Delete room if empty
-            if not self.rooms[old_room]:
-                del self.rooms[old_room]
-                logger.info("Room %s deleted (empty).", old_room)
+            if not old_room.members:
+                del self.rooms[old_room.name]
+                logger.info("Room %s deleted (empty).", old_room.name)
 
         # Add to new room
-        client.room_name = room_name
-        if room_name not in self.rooms:
-            self.rooms[room_name] = set()
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = Room(room_name)
             logger.info("Room %s created.", room_name)
 
-        self.rooms[room_name].add(client)
-        await client.send_message(f"You joined room: {room_name}")
-        await self.system_message(room_name, f"{client.name} joined the room.")
-
-    async def system_message(self, room_name: str, message: str) -> None:
-        if room_name in self.rooms:
-            for user in self.rooms[room_name]:
-                await user.send_message(f"* {message}")
+        room.members.add(client)
+        client.room = room
+        client.send_message(f"You joined room: {room_name}")
+        room.broadcast(f"* {client.name} joined the room.")
 
     async def cleanup_client(self, client: Client) -> None:
         self.clients.discard(client)
+        self.names.pop(client.name.lower(), None)
 
-        if client.room_name in self.rooms:
-            self.rooms[client.room_name].discard(client)
-            await self.system_message(client.room_name, f"{client.name} has disconnected.")
-            if not self.rooms[client.room_name]:
-                del self.rooms[client.room_name]
-                logger.info("Room %s deleted (empty).", client.room_name)
+        room = client.room
+        if room is not None:
+            room.members.discard(client)
+            room.broadcast(f"* {client.name} has disconnected.")
+            if not room.members:
+                del self.rooms[room.name]
+                logger.info("Room %s deleted (empty).", room.name)
 
         await client.disconnect()
 
     # ==========================================
     # Command Handling Logic
     # ==========================================
-    async def handle_command(self, client: Client, command_str: str) -> None:
-        parts = command_str[1:].split(" ", 1)
-        cmd_name = parts[0].lower()
-        args = parts[1] if len(parts) > 1 else ""
+    async def handle_command(self, client: Client, command: bytes) -> None:
+        head, _, args = command[1:].partition(b" ")
+        cmd_name = head.lower()
 
-        # Look for a method named cmd_{cmd_name}
-        handler = getattr(self, f"cmd_{cmd_name}", None)
+        # Look up the method named cmd_{cmd_name}
+        handler = self._commands.get(cmd_name)
 
         if handler:
             try:
-                await handler(client, args)
+                await handler(client, args.decode())
             except Exception:
                 logger.exception("Command error")
-                await client.send_message("Error executing command.")
+                client.send_message("Error executing command.")
         else:
-            await client.send_message(f"Unknown command: {cmd_name.upper()}")
+            client.send_message(f"Unknown command: {cmd_name.decode(errors='replace').upper()}")
 
     # --- Commands Definition ---
     # To add a new command, just define async def cmd_name(self, client, args)
 
     async def cmd_join(self, client: Client, args: str) -> None:
         if not args or not args.strip().isalnum():
-            await client.send_message("Usage: /JOIN <room_name>")
+            client.send_message("Usage: /JOIN <room_name>")
             return
-        await self.join_room(client, args.strip())
+        self.join_room(client, args.strip())
 
     async def cmd_quit(self, client: Client, args: str) -> None:  # noqa: ARG002, PLR6301
-        await client.send_message("Goodbye!")
+        client.send_message("Goodbye!")
         await client.disconnect()
 
     async def cmd_rooms(self, client: Client, args: str) -> None:  # noqa: ARG002
-        room_list = ", ".join(f"{name} ({len(users)})" for name, users in self.rooms.items())
-        await client.send_message(f"Active Rooms: {room_list}")
+        room_list = ", ".join(f"{name} ({len(room.members)})" for name, room in self.rooms.items())
+        client.send_message(f"Active Rooms: {room_list}")
 
-    async def cmd_who(self, client: Client, args: str) -> None:  # noqa: ARG002
-        if client.room_name in self.rooms:
-            users: str = ", ".join(u.name for u in self.rooms[client.room_name])
-            await client.send_message(f"Users in {client.room_name}: {users}")
+    async def cmd_who(self, client: Client, args: str) -> None:  # noqa: ARG002, PLR6301
+        if client.room is not None:
+            users: str = ", ".join(u.name for u in client.room.members)
+            client.send_message(f"Users in {client.room.name}: {users}")
 
     async def cmd_help(self, client: Client, args: str) -> None:  # noqa: ARG002
-        # Dynamically find commands
-        cmds = ["/" + m[4:].upper() for m in dir(self) if m.startswith("cmd_")]
-        await client.send_message(f"Available commands: {', '.join(cmds)}")
+        client.send_message(self._help_text)
 
 
 async def main() -> None:
@@ -259,4 +525,5 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    with configure_logging():
+        asyncio.run(main(), loop_factory=None if sys.platform == "win32" else uvloop.new_event_loop)